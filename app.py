@@ -1,18 +1,54 @@
 import streamlit as st
-import openai
-from openai import OpenAI
-from openai import AssistantEventHandler
+from openai import OpenAI, AsyncOpenAI
+from openai import AsyncAssistantEventHandler
 from typing_extensions import override
 import os
+import time
+import asyncio
 from dotenv import load_dotenv
 from sync import sync_assistant_files
 from datetime import datetime
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 import logging
+import queue
+import atexit
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from streamlit_feedback import streamlit_feedback
 
-# Set up logging
+class BufferedFileHandler(logging.FileHandler):
+    """FileHandler that writes through a 64KB buffer and flushes on a timer instead of per record"""
+    BUFFER_SIZE = 65536
+    FLUSH_INTERVAL = 0.5
+
+    def __init__(self, filename, mode='a', encoding=None, delay=False, errors=None):
+        super().__init__(filename, mode, encoding, delay, errors)
+        self._stop_flushing = threading.Event()
+        threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.BUFFER_SIZE,
+                    encoding=self.encoding, errors=self.errors)
+
+    def flush(self):
+        # Called by emit() after every record; the timer thread does the real flush
+        pass
+
+    def _flush_periodically(self):
+        while not self._stop_flushing.wait(self.FLUSH_INTERVAL):
+            super().flush()
+
+    def close(self):
+        self._stop_flushing.set()
+        super().close()
+
+# Set up logging once per process; records are queued and written by a background thread
+@st.cache_resource(show_spinner=False)
 def setup_logging():
     # Create logs directory if it doesn't exist
     log_dir = Path("logs")
@@ -21,56 +57,95 @@ def setup_logging():
     # Create log file with current date
     log_file = log_dir / f"chat_{datetime.now().strftime('%Y-%m-%d')}.log"
     
-    # Configure logging
+    # The listener thread owns the real handlers so callers only pay for a queue put
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = BufferedFileHandler(log_file, delay=True)
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    # Configure logging; the listener's handlers add the timestamp and level, so the
+    # queue handler must pass the bare message through instead of basicConfig's default format
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()
-        ]
+        format='%(message)s',
+        handlers=[QueueHandler(log_queue)]
     )
     return logging.getLogger(__name__)
 
 # Initialize logger
 logger = setup_logging()
 
-# Load environment variables
-load_dotenv()
+OPENAI_PROJECT = "proj_jiG8eccaCUMs4uKfXqUouCeN"
+
+# Initialize OpenAI client lazily, only once a request has passed validation
+@st.cache_resource(show_spinner=False)
+def get_client():
+    # Load environment variables
+    load_dotenv()
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), project=OPENAI_PROJECT)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), project="proj_jiG8eccaCUMs4uKfXqUouCeN")
 
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config.yaml')
 
-# Load assistant configurations from YAML file
-def load_config():
-    config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
+# Load assistant configurations from YAML file, cached until the file changes
+@st.cache_data(show_spinner=False)
+def load_config(config_path, mtime):
     with open(config_path, 'r', encoding='utf-8') as f:
-        config = yaml.safe_load(f)
+        config = yaml.load(f, Loader=SafeLoader)
     return config.get('assistants', {})
 
+def get_assistants():
+    return load_config(CONFIG_PATH, os.stat(CONFIG_PATH).st_mtime)
+
 # Load assistants configuration
-ASSISTANTS = load_config()
+ASSISTANTS = get_assistants()
+
+class StreamHandler(AsyncAssistantEventHandler):
+    # Minimum seconds between placeholder re-renders while streaming
+    FLUSH_INTERVAL = 0.05
 
-class StreamHandler(AssistantEventHandler):
     def __init__(self, message_placeholder):
         super().__init__()
         self.message_placeholder = message_placeholder
-        self.full_response = ""
+        self._chunks: list[str] = []
+        self._last_flush = 0.0
+        self._pending = False
+
+    @property
+    def full_response(self) -> str:
+        return "".join(self._chunks)
+
+    def _flush(self):
+        self.message_placeholder.markdown(self.full_response + "▌")
+        self._last_flush = time.monotonic()
+        self._pending = False
         
     @override
-    def on_text_created(self, text) -> None:
+    async def on_text_created(self, text) -> None:
         self.message_placeholder.markdown("")
         
     @override
-    def on_text_delta(self, delta, snapshot):
-        self.full_response += delta.value
-        self.message_placeholder.markdown(self.full_response + "▌")
+    async def on_text_delta(self, delta, snapshot):
+        self._chunks.append(delta.value)
+        if time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self._flush()
+        else:
+            self._pending = True
+
+    @override
+    async def on_end(self) -> None:
+        if self._pending:
+            self._flush()
         
-    def on_tool_call_created(self, tool_call):
+    async def on_tool_call_created(self, tool_call):
         self.message_placeholder.markdown(f"\n{tool_call.type}\n")
         
-    def on_tool_call_delta(self, delta, snapshot):
+    async def on_tool_call_delta(self, delta, snapshot):
         if delta.type == 'code_interpreter':
             if delta.code_interpreter.input:
                 self.message_placeholder.markdown(delta.code_interpreter.input)
@@ -79,6 +154,17 @@ class StreamHandler(AssistantEventHandler):
                     if output.type == "logs":
                         self.message_placeholder.markdown(f"\n{output.logs}")
 
+async def stream_response(thread_id, assistant_id, handler):
+    """Stream an assistant run without blocking on sync network I/O"""
+    # The async client is bound to the event loop, so it lives only as long as this run
+    async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), project=OPENAI_PROJECT) as async_client:
+        async with async_client.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            event_handler=handler
+        ) as stream:
+            await stream.until_done()
+
 def handle_feedback(feedback):
     """Handle feedback from users"""
     feedback_type = feedback.get("type")
@@ -86,6 +172,36 @@ def handle_feedback(feedback):
     text = feedback.get("text", "")
     logger.info(f"Received feedback - Type: {feedback_type}, Score: {score}, Text: {text}")
 
+# Number of most recent messages rendered before "show earlier" is clicked
+HISTORY_PAGE_SIZE = 20
+
+def show_earlier_history():
+    """Reveal another page of older messages; widget callbacks run before the rerun they trigger"""
+    st.session_state.history_limit += HISTORY_PAGE_SIZE
+
+@st.fragment
+def render_history():
+    """Render the chat history; widget interactions here rerun only this fragment"""
+    messages = st.session_state.messages
+    if "history_limit" not in st.session_state:
+        st.session_state.history_limit = HISTORY_PAGE_SIZE
+
+    hidden = len(messages) - st.session_state.history_limit
+    if hidden > 0:
+        # A fixed key keeps the button's identity while the hidden count in its label changes
+        st.button(f"显示更早的消息（{hidden}条）", key="show_earlier_history", on_click=show_earlier_history)
+
+    for message in messages[-st.session_state.history_limit:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            # Add feedback component for assistant messages
+            if message["role"] == "assistant":
+                streamlit_feedback(
+                    feedback_type="thumbs",
+                    key=message["fb_key"],  # Unique key precomputed when the message was added
+                    on_submit=handle_feedback
+                )
+
 def main():
     # Get assistant type from URL parameters
     assistant_type = st.query_params.get("type")  # Default to ultimate if not specified
@@ -98,6 +214,7 @@ def main():
         
     # Get assistant config
     assistant = ASSISTANTS[assistant_type]
+    client = get_client()
     
     # Log assistant type and sync status
     logger.info(f"Session started with assistant type: {assistant_type}")
@@ -126,16 +243,7 @@ def main():
     st.caption(assistant["description"] + " 我也可能会犯错。请核查重要信息。")
 
     # Display chat messages
-    for idx, message in enumerate(st.session_state.messages):
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-            # Add feedback component for assistant messages
-            if message["role"] == "assistant":
-                streamlit_feedback(
-                    feedback_type="thumbs",
-                    key=f"feedback_{idx}",  # Add unique key based on message index
-                    on_submit=handle_feedback
-                )
+    render_history()
 
     # Chat input
     prompt = st.chat_input("请输入您的问题...")
@@ -165,30 +273,25 @@ def main():
             handler = StreamHandler(message_placeholder)
             
             # Stream the response
-            with client.beta.threads.runs.stream(
-                thread_id=st.session_state.thread.id,
-                assistant_id=assistant["id"],
-                event_handler=handler
-            ) as stream:
-                stream.until_done()
+            asyncio.run(stream_response(st.session_state.thread.id, assistant["id"], handler))
                 
+            full_response = handler.full_response
+
             # Remove the cursor
-            message_placeholder.markdown(handler.full_response)
-            
-            # Add feedback component for the new response
-            streamlit_feedback(
-                feedback_type="thumbs",
-                key=f"feedback_{len(st.session_state.messages)}",  # Add unique key based on new message index
-                on_submit=handle_feedback
-            )
+            message_placeholder.markdown(full_response)
             
             # Log assistant response
-            logger.info(f"Assistant response: {handler.full_response}")
+            logger.info(f"Assistant response: {full_response}")
             
             # Add the complete response to chat history
+            fb_key = f"feedback_{len(st.session_state.messages)}"  # Unique key based on new message index
             st.session_state.messages.append(
-                {"role": "assistant", "content": handler.full_response}
+                {"role": "assistant", "content": full_response, "fb_key": fb_key}
             )
 
+        # Redraw through render_history so the new exchange, and its feedback component,
+        # live only inside the fragment; otherwise a fragment rerun would show it twice
+        st.rerun()
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
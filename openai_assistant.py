@@ -1,9 +1,10 @@
-import time
+import os
+import asyncio
 import logging
-import traceback
-from concurrent.futures import Future, ThreadPoolExecutor, as_completed
-from openai import OpenAI, NotFoundError
-from openai.types.beta.threads import Run
+import aiofiles
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import OpenAI, AsyncOpenAI, NotFoundError
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -20,17 +21,32 @@ ch.setFormatter(formatter)
 # Add the handlers to the logger
 logger.addHandler(ch)
 
+# 替换向量库后在后台清理旧向量库，不阻塞同步返回
+_CLEANUP_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vs_cleanup")
+
 # Assistant类，用于处理openai的对话请求
 class Assistant():
     def __init__(self, assistant_id: str, client: OpenAI):
         self.assistant_id = assistant_id
         self.client = client
         self.topic = assistant_id + "_vector_store"
+        self._assistant_cache = None
+
+    def _update_assistant(self, **kwargs):
+        """
+        更新 assistant，并用返回结果刷新缓存，避免再次 retrieve
+        """
+        self._assistant_cache = self.client.beta.assistants.update(
+            assistant_id=self.assistant_id, **kwargs
+        )
+        return self._assistant_cache
 
     def get_vector_store_ids(self):
         vector_store = []
         try:
-            my_assistant = self.client.beta.assistants.retrieve(self.assistant_id)
+            if self._assistant_cache is None:
+                self._assistant_cache = self.client.beta.assistants.retrieve(self.assistant_id)
+            my_assistant = self._assistant_cache
             file_search = my_assistant.tool_resources.file_search
             if file_search is None:
                 logger.error(f"[asst_id={self.assistant_id}]：assistant没有启用file_search工具")
@@ -84,9 +100,20 @@ class Assistant():
             logger.error(f"[asst_id={self.assistant_id}]：删除 OpenAI 文件 '{file_id}' 失败: {e}")
             return False
 
+    def delete_openai_files(self, file_ids: list) -> bool:
+        """
+        并发删除多个 OpenAI 文件
+        :param file_ids: 文件 ID 列表
+        :return bool: 是否全部删除成功
+        """
+        if not file_ids:
+            return True
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            return all(list(executor.map(self.delete_openai_file, file_ids)))
+
     def empty_files(self) -> bool:
         """
-        清空assistant的文件，通过分离并删除向量库
+        清空assistant的文件，通过分离并删除向量库及其中的 OpenAI 文件
         :return: 是否清空成功
         """
         try:
@@ -97,110 +124,267 @@ class Assistant():
                 return True
 
             # 2. 分离 assistant 与向量库的关联
-            self.client.beta.assistants.update(
-                assistant_id=self.assistant_id,
+            self._update_assistant(
                 tool_resources={"file_search": {"vector_store_ids": []}},
             )
             
-            # 3. 删除所有向量库
-            for vector_store_id in vector_store_ids:
+            # 3. 删除向量库及其中的 OpenAI 文件
+            return self.delete_vector_stores(vector_store_ids)
+            
+        except Exception as e:
+            logger.error("[asst_id=%s]：清空助手文件失败：%s", self.assistant_id, e, exc_info=True)
+            return False
+
+    def delete_vector_stores(self, vector_store_ids: list, keep_file_ids=()) -> bool:
+        """
+        删除未关联到 assistant 的向量库及其中的 OpenAI 文件
+        :param vector_store_ids: 向量库 ID 列表
+        :param keep_file_ids: 仍被使用、不能删除的 OpenAI 文件 ID
+        :return: 是否所有向量库都删除成功
+        """
+        # 收集向量库中的文件，删除向量库后这些 OpenAI 文件不会被自动删除
+        keep_file_ids = set(keep_file_ids)
+        file_ids = [
+            file_ins.id
+            for vector_store_id in vector_store_ids
+            for file_ins in self.client.vector_stores.files.list(vector_store_id=vector_store_id, limit=100)
+            if file_ins.id not in keep_file_ids
+        ]
+
+        # 在同一个线程池中并发删除所有向量库及其 OpenAI 文件，两类请求互不依赖
+        MAX_CONCURRENCY = 10
+        success = True
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+            vs_futures = {
+                executor.submit(self.client.vector_stores.delete, vector_store_id=vector_store_id): vector_store_id
+                for vector_store_id in vector_store_ids
+            }
+            file_futures = {
+                executor.submit(self.delete_openai_file, file_id): file_id
+                for file_id in file_ids
+            }
+            for future in as_completed(vs_futures):
+                vector_store_id = vs_futures[future]
                 try:
-                    deleted_vector_store = self.client.vector_stores.delete(vector_store_id=vector_store_id)
+                    deleted_vector_store = future.result()
                     if deleted_vector_store.deleted:
                         logger.info(f"[asst_id={self.assistant_id}]：成功删除向量库 '{vector_store_id}'")
                     else:
                         logger.error(f"[asst_id={self.assistant_id}]：删除向量库 '{vector_store_id}' 失败")
                 except Exception as e:
                     logger.error(f"[asst_id={self.assistant_id}]：删除向量库 '{vector_store_id}' 时发生错误：{e}")
-                    return False
+                    success = False
 
-            return True
-            
+            # OpenAI 文件删除失败只会残留存储，不影响助手
+            failed_openai_files = [file_futures[f] for f in as_completed(file_futures) if not f.result()]
+            if failed_openai_files:
+                logger.warning(f"[asst_id={self.assistant_id}]：{len(failed_openai_files)}个 OpenAI 文件删除失败：{failed_openai_files}")
+
+        return success
+
+    def _cleanup_vector_stores(self, vector_store_ids: list, keep_file_ids: list) -> None:
+        try:
+            self.delete_vector_stores(vector_store_ids, keep_file_ids)
         except Exception as e:
-            logger.error(f"[asst_id={self.assistant_id}]：清空助手文件失败：{e}\n{traceback.format_exc()}")
-            return False
+            logger.error("[asst_id=%s]：后台清理向量库失败：%s", self.assistant_id, e, exc_info=True)
+
+    def delete_vector_stores_in_background(self, vector_store_ids: list, keep_file_ids: list = ()) -> None:
+        """
+        在后台线程中删除未关联的向量库及其 OpenAI 文件，不等待完成，也不抛出异常
+        :param vector_store_ids: 向量库 ID 列表
+        :param keep_file_ids: 仍被使用、不能删除的 OpenAI 文件 ID
+        """
+        try:
+            _CLEANUP_EXECUTOR.submit(self._cleanup_vector_stores, list(vector_store_ids), list(keep_file_ids))
+        except Exception as e:
+            logger.error("[asst_id=%s]：提交后台清理向量库任务失败：%s", self.assistant_id, e, exc_info=True)
+
+    def remove_files(self, vector_store_id: str, file_ids: list) -> bool:
+        """
+        从向量库中移除文件并删除对应的 OpenAI 文件，两类请求在同一个线程池中并发执行
+        :param vector_store_id: 向量库 ID
+        :param file_ids: 文件 ID 列表
+        :return: 是否全部从向量库中移除成功
+        """
+        if not file_ids:
+            return True
+        MAX_CONCURRENCY = 10
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+            vs_futures = [
+                executor.submit(self.delete_vector_store_file, vector_store_id, file_id)
+                for file_id in file_ids
+            ]
+            file_futures = [executor.submit(self.delete_openai_file, file_id) for file_id in file_ids]
+            success = all(future.result() for future in vs_futures)
+            for future in file_futures:
+                future.result()
+        logger.info(f"[asst_id={self.assistant_id}]：从向量库 '{vector_store_id}' 移除{len(file_ids)}个文件")
+        return success
 
-    def create_vs(self,file_paths_and_urls: list) -> bool:
+    def create_vs(self,file_paths_and_urls: list, file_id_map: dict = None) -> bool:
         """
         创建向量库并上传文件
         :param file_paths: url和文件路径
+        :param file_id_map: 可选，上传后填入 url 到 file_id 的对应关系
         :return: 是否上传成功
         """
+        return self.upload_file(file_paths_and_urls, self.ensure_vector_store(), file_id_map)
+
+    def create_vector_store(self) -> str:
+        """
+        新建向量库，不关联到 assistant
+        :return: 向量库 ID
+        """
+        vector_store = self.client.vector_stores.create(
+            name=self.topic,
+            expires_after={
+                "anchor": "last_active_at",
+                "days": 7
+            })
+        return vector_store.id
+
+    def replace_vector_store(self, vector_store_id: str, keep_file_ids: list = ()) -> None:
+        """
+        将 assistant 一次性切换到已填充好文件的新向量库，切换期间助手不会出现无文件可用的状态
+        旧向量库及其 OpenAI 文件在后台线程中删除，不等待完成；切换成功后不会再抛出异常
+        :param vector_store_id: 新向量库 ID
+        :param keep_file_ids: 新向量库中的文件 ID，即使也在旧向量库中也不删除
+        """
+        old_vector_store_ids = [
+            old_id for old_id in self.get_vector_store_ids() if old_id != vector_store_id
+        ]
+        self._update_assistant(
+            tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}},
+        )
+        logger.info(f"[asst_id={self.assistant_id}]：已切换到向量库 '{vector_store_id}'")
+        if old_vector_store_ids:
+            self.delete_vector_stores_in_background(old_vector_store_ids, keep_file_ids)
+
+    def ensure_vector_store(self) -> str:
+        """
+        确保 assistant 关联且仅关联一个向量库，没有则新建
+        :return: 向量库 ID
+        """
         vector_store_ids = self.get_vector_store_ids()
         if not vector_store_ids:
-            vector_store = self.client.vector_stores.create(
-                name=self.topic,
-                expires_after={
-                    "anchor": "last_active_at",
-                    "days": 7
-                })
-            vector_store_ids = [vector_store.id]
-            assistant = self.client.beta.assistants.update(
-                assistant_id=self.assistant_id,
+            vector_store_ids = [self.create_vector_store()]
+            self._update_assistant(
                 tool_resources={"file_search": {"vector_store_ids": vector_store_ids}},
             )
         elif len(vector_store_ids) > 1:
-            assistant = self.client.beta.assistants.update(
-                assistant_id=self.assistant_id,
+            self._update_assistant(
                 tool_resources={"file_search": {"vector_store_ids": [vector_store_ids[0]]}},
             )
-        return self.upload_file(file_paths_and_urls,vector_store_ids[0])
+        return vector_store_ids[0]
 
-    def _upload_single_file(self, path):
-        with open(path, "rb") as file:
-            return self.client.files.create(file=file, purpose="assistants")
+    def _async_client(self) -> AsyncOpenAI:
+        """
+        按同步客户端的配置创建异步客户端
+        异步客户端的连接池绑定在事件循环上，因此每次 asyncio.run 都需新建
+        """
+        return AsyncOpenAI(
+            api_key=self.client.api_key,
+            organization=self.client.organization,
+            project=self.client.project,
+            base_url=self.client.base_url,
+        )
 
+    async def _upload_single_file(self, async_client: AsyncOpenAI, semaphore: asyncio.Semaphore, path):
+        async with semaphore:
+            async with aiofiles.open(path, "rb") as file:
+                data = await file.read()
+            return await async_client.files.create(file=(os.path.basename(path), data), purpose="assistants")
 
-    def upload_file(self, file_paths_and_urls: list, vector_store_id: str) -> bool:
-        MAX_RETRIES = 3
-        BATCH_SIZE = 100
+    @asynccontextmanager
+    async def uploader(self, max_concurrency: int = 5):
+        """
+        在当前事件循环中提供一个共享客户端和并发上限的上传函数，供调用方边产生文件边上传
+        :param max_concurrency: 最大并发上传数
+        :return: 异步函数 upload(path)，返回 OpenAI 文件对象
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async with self._async_client() as async_client:
+            yield lambda path: self._upload_single_file(async_client, semaphore, path)
+
+    async def _upload_files(self, paths: list, max_concurrency: int) -> list:
+        """
+        在同一个事件循环中并发上传文件，任一失败即抛出异常，剩余任务由 asyncio.run 取消
+        :param paths: 文件路径列表
+        :param max_concurrency: 最大并发上传数
+        :return: 与 paths 顺序一致的 OpenAI 文件对象列表
+        """
+        async with self.uploader(max_concurrency) as upload:
+            return await asyncio.gather(*[upload(path) for path in paths])
+
+    def upload_files(self, file_paths_and_urls: list) -> list:
+        """
+        并发上传文件到 OpenAI 存储，不添加到向量库
+        :param file_paths_and_urls: url和文件路径
+        :return: (url, OpenAI 文件对象) 列表
+        """
         MAX_CONCURRENCY = 5
+        uploaded_files = asyncio.run(
+            self._upload_files([path for _, path in file_paths_and_urls], MAX_CONCURRENCY)
+        )
+        return [(url, file) for (url, _), file in zip(file_paths_and_urls, uploaded_files)]
+
+    def upload_file(self, file_paths_and_urls: list, vector_store_id: str, file_id_map: dict = None) -> bool:
         logger.debug(f"[asst_id={self.assistant_id}]：上传{len(file_paths_and_urls)}个文件到向量库 '{vector_store_id}'")
 
         # 1.上传 files
-        results = []
-        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
-            futures = {
-                executor.submit(
-                    self._upload_single_file,
-                    path=path,
-                ): url
-                for url, path in file_paths_and_urls
-            }
+        results = self.upload_files(file_paths_and_urls)
 
-        for future in as_completed(futures):
-            url = futures[future]
-            exc = future.exception()
-            if exc:
-                raise exc
-            results.append((url, future.result()))
+        # 2.将 file_id 和url的对应关系返回给调用方储存
+        if file_id_map is not None:
+            file_id_map.update((url, file.id) for url, file in results)
 
-        # 2.将 file_id 和url的对应关系储存在数据库中
+        # 3.将files添加到vector store
+        return self.add_files_to_vector_store([f.id for _, f in results], vector_store_id)
 
-        # 3.将files添加到vector store，带重试逻辑,只有上传失败的情况下会重试
-        file_ids = [f.id for _, f in results]
+    def add_files_to_vector_store(self, file_ids: list, vector_store_id: str) -> bool:
+        """
+        将已上传的文件批量添加到向量库，带重试逻辑,只有添加失败的情况下会重试
+        :param file_ids: OpenAI 文件 ID 列表
+        :param vector_store_id: 向量库 ID
+        :return: 是否全部添加成功
+        """
+        MAX_RETRIES = 3
+        BATCH_SIZE = 100
+        MAX_CONCURRENCY = 5
+        if not file_ids:
+            return True
         total_files = len(file_ids)
         retry_count = 0
         successful_files = 0
         while retry_count < MAX_RETRIES and len(file_ids):
             ## 3.1 批量上传文件
             failed_file_ids = []
-            for i in range(0, len(file_ids), BATCH_SIZE):
-                batch = file_ids[i:i + BATCH_SIZE]
-                file_batch = self.client.vector_stores.file_batches.create_and_poll(
+            # 先创建所有批次，再并发轮询，使各批次的处理时间重叠
+            file_batches = [
+                self.client.vector_stores.file_batches.create(
                     vector_store_id=vector_store_id,
-                    file_ids=batch
+                    file_ids=file_ids[i:i + BATCH_SIZE]
                     # chunking_strategy=chunking_strategy
                 )
+                for i in range(0, len(file_ids), BATCH_SIZE)
+            ]
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+                polled_batches = list(executor.map(
+                    lambda file_batch: self.client.vector_stores.file_batches.poll(
+                        file_batch.id, vector_store_id=vector_store_id
+                    ),
+                    file_batches,
+                ))
 
+            for batch_no, file_batch in enumerate(polled_batches, 1):
                 if file_batch.status == "completed":
                     successful_files += file_batch.file_counts.completed
                     logger.info(
-                        f"[asst_id={self.assistant_id}]：成功上传第 {i // BATCH_SIZE + 1} 批文件：{file_batch.file_counts}"
+                        f"[asst_id={self.assistant_id}]：成功上传第 {batch_no} 批文件：{file_batch.file_counts}"
                     )
                 else:
                     logger.error(
-                        f"[asst_id={self.assistant_id}]：第 {i // BATCH_SIZE + 1} 批文件上传失败，文件上传终止，状态 '{file_batch.status}'：{file_batch.file_counts}")
+                        f"[asst_id={self.assistant_id}]：第 {batch_no} 批文件上传失败，文件上传终止，状态 '{file_batch.status}'：{file_batch.file_counts}")
                     return False
 
             logger.info(
@@ -208,20 +392,15 @@ class Assistant():
             )
             # 3.2 获取上传失败的文件
             try:
-                # 获取这个批次中失败的文件ID
-                after = None
-                limit = 100
-                while True:
-                    response = self.client.vector_stores.files.list(
+                # 获取这个批次中失败的文件ID，由 SDK 自动翻页
+                failed_file_ids.extend(
+                    file_ins.id
+                    for file_ins in self.client.vector_stores.files.list(
                         vector_store_id=vector_store_id,
                         filter="failed",
-                        limit=limit,
-                        after=after
+                        limit=100,
                     )
-                    failed_file_ids.extend([file_ins.id for file_ins in response.data])
-                    if len(response.data) < limit:
-                        break
-                    after = response.data[-1].id
+                )
             except Exception as e:
                 logger.error(f"[asst_id={self.assistant_id}]： 获取失败文件列表时发生异常：{e}")
 
@@ -235,9 +414,12 @@ class Assistant():
                 logger.info(
                     f"[asst_id={self.assistant_id}]：{total_files-successful_files}个文件上传失败，准备第{retry_count + 2}次重试"
                 )
-                # 删除向量库中失败的文件
-                for failed_id in failed_file_ids:
-                    self.delete_vector_store_file(vector_store_id, failed_id)
+                # 并发删除向量库中失败的文件
+                with ThreadPoolExecutor(max_workers=10) as executor:
+                    list(executor.map(
+                        lambda failed_id: self.delete_vector_store_file(vector_store_id, failed_id),
+                        failed_file_ids,
+                    ))
 
                 # 更新file_ids为失败的文件列表，准备重试
                 file_ids = failed_file_ids
@@ -1,23 +1,88 @@
 import re
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
 import streamlit as st
-import requests
 import os
+import time
+import json
+import shutil
+import hashlib
+import asyncio
+import httpx
 import tempfile
-import random
-import string
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import OpenAI
-from typing import Dict, Any, List
-from datetime import datetime
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from openai_assistant import Assistant
 
-def extract_markdown_links(content):    
-    # Pattern to match markdown links: [text](url)
-    pattern = r'\[([^\]]+)\]\(([^)]+)\)'
-    matches = re.findall(pattern, content)
+# Markdown links whose URL is non-empty, has no whitespace and ends in .md: [text]( url.md )
+_MD_LINK_RE = re.compile(r'\[([^\]]+)\]\(\s*([^)\s]+\.md)\s*\)')
+# Characters not allowed in filenames
+_INVALID_FILENAME_RE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+# Maximum number of markdown files downloaded at the same time
+DOWNLOAD_CONCURRENCY = 16
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# HTTP validators (ETag/Last-Modified) of downloaded URLs, kept in the cache directory
+HTTP_CACHE_FILE = ".cache.json"
+# Files currently in the assistant's vector store with their content hashes, kept in the cache directory
+MANIFEST_FILE = ".manifest.json"
+
+# Maximum number of files uploaded to OpenAI storage at the same time
+UPLOAD_CONCURRENCY = 8
+# Maximum number of files deleted from OpenAI storage at the same time
+DELETE_CONCURRENCY = 16
+
+# Blocking file reads/writes issued from the event loop; a handful of threads saturates local disk
+_FILE_IO_EXECUTOR = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="sync-file-io")
+
+# Connections kept to a docs host; with HTTP/2 many downloads share each one
+HTTP_MAX_CONNECTIONS = 8
+
+class ProgressLog:
+    """Batch per-file Streamlit updates so large syncs don't send one websocket frame per file.
+    
+    Messages are buffered and written as one log entry, and the progress bar is redrawn,
+    at most once every INTERVAL seconds and on flush().
     
-    # Filter only .md links
-    md_links = [(text, url) for text, url in matches if url.endswith('.md')]
-    return md_links
+    Args:
+        status: Streamlit status placeholder, reused as the progress bar
+        log_container: Streamlit log container
+        label: Text shown on the progress bar, e.g. "Downloading"
+    """
+    INTERVAL = 0.2
+
+    def __init__(self, status, log_container, label: str = ""):
+        self.status = status
+        self.log_container = log_container
+        self.label = label
+        self._messages = []
+        self._done = 0
+        self._total = 0
+        self._last_flush = 0.0
+
+    def add(self, message: str, done: Optional[int] = None, total: Optional[int] = None) -> None:
+        self._messages.append(message)
+        self.update(done, total)
+
+    def update(self, done: Optional[int] = None, total: Optional[int] = None) -> None:
+        """Advance the progress bar without logging a message."""
+        if done is not None:
+            self._done, self._total = done, total
+        if time.monotonic() - self._last_flush >= self.INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._total:
+            self.status.progress(min(self._done / self._total, 1.0), text=f"{self.label} {self._done}/{self._total}")
+        if self._messages:
+            self.log_container.info("\n\n".join(self._messages))
+            self._messages.clear()
+        self._last_flush = time.monotonic()
 
 def setup_ui_containers():
     """Create and return UI containers for status and logging."""
@@ -34,39 +99,284 @@ def create_temp_directory(assistant_id: str) -> str:
     Returns:
         str: Path to the created temporary directory
     """
-    random_suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=6))
-    temp_dir = os.path.join("tmp", f"sync_{assistant_id}_{random_suffix}")
-    os.makedirs(temp_dir, exist_ok=True)
-    return temp_dir
+    os.makedirs("tmp", exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"sync_{assistant_id}_", dir="tmp")
+
+def get_cache_directory(assistant_id: str) -> str:
+    """Return the directory that persists download caches for an assistant across syncs.
+    
+    Args:
+        assistant_id: The ID of the assistant
+    Returns:
+        str: Path to the cache directory
+    """
+    cache_dir = os.path.join("tmp", f"sync_{assistant_id}")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def load_json(path: str) -> Dict[str, Any]:
+    """Load a JSON cache file, returning an empty dict if it is missing or corrupt."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_json(path: str, data: Dict[str, Any]) -> None:
+    """Atomically write a JSON cache file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def _cached_name(url: str) -> str:
+    """Name of the cached copy of url inside the cache directory."""
+    return hashlib.sha1(url.encode('utf-8')).hexdigest() + ".md"
+
+@contextmanager
+def sync_lock(assistant_id: str):
+    """Hold an exclusive cross-process lock while syncing an assistant.
+    
+    Args:
+        assistant_id: The ID of the assistant
+    Yields:
+        bool: False if another process is already syncing this assistant
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs("tmp", exist_ok=True)
+    with open(os.path.join("tmp", f"sync_{assistant_id}.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _http_client() -> httpx.AsyncClient:
+    """Create the HTTP/2 client shared by the llm.txt fetch and all markdown downloads."""
+    limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS)
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        # DOWNLOAD_CONCURRENCY already bounds in-flight requests; without HTTP/2 some of them
+        # queue for one of the HTTP_MAX_CONNECTIONS connections, which must not time out
+        timeout=httpx.Timeout(30, connect=5, pool=None),
+        # Retries connection failures only; HTTP errors still fail the sync
+        transport=httpx.AsyncHTTPTransport(http2=True, limits=limits, retries=3),
+    )
+
+async def _fetch(session: httpx.AsyncClient, url: str, sem: asyncio.Semaphore, path: str,
+                 validators: Dict[str, Optional[str]]) -> Optional[Dict[str, Optional[str]]]:
+    """Download a single URL to path, bounded by the shared semaphore.
+    
+    Returns:
+        The response's ETag/Last-Modified validators and the body's SHA-256,
+        or None if the server answered 304 Not Modified
+    """
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    async with sem:
+        async with session.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            # Markdown files are small, so collect the body and write it with a single syscall
+            data = bytearray()
+            h = hashlib.sha256()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                h.update(chunk)
+                data += chunk
+    await _run_file_io(_write_file, path, data)
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": h.hexdigest(),
+    }
+
+async def _run_file_io(func, *args):
+    """Run blocking file I/O on the dedicated file I/O pool without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_FILE_IO_EXECUTOR, func, *args)
+
+def _write_file(path: str, data: bytes) -> None:
+    """Write data to path with raw os.write calls, bypassing Python's buffered file layer."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+async def iter_markdown_links(session: httpx.AsyncClient, llm_txt_url: str) -> AsyncIterator[Tuple[str, str]]:
+    """Stream llm.txt and yield its markdown links as soon as each line arrives.
+    
+    Args:
+        session: HTTP client to fetch with
+        llm_txt_url: URL to the llm.txt file
+    Yields:
+        Tuple[str, str]: (text, url) of each .md link
+    """
+    async with session.stream("GET", llm_txt_url) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            for link in _MD_LINK_RE.findall(line):
+                yield link
+
+async def _download_all(llm_txt_url: str, temp_dir: str, cache_dir: Optional[str], status, log_container,
+                        downloaded: Optional[asyncio.Queue] = None) -> List[Tuple[str, str]]:
+    """Download markdown links concurrently as they are discovered, raising the first failure after all complete.
+    
+    The (path, sha256) of every file is put on the downloaded queue, if given, as soon as it is on disk.
+    
+    Returns:
+        List[Tuple[str, str]]: (path, sha256) of every downloaded file
+    """
+    sem = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    http_cache = load_json(os.path.join(cache_dir, HTTP_CACHE_FILE)) if cache_dir else {}
+    progress = ProgressLog(status, log_container, "Downloading")
+    files = []
+    done = 0
 
-def download_markdown_files(llm_txt_url: str, temp_dir: str, status, log_container) -> None:
+    async with _http_client() as session:
+        async def download(filename: str, url: str) -> None:
+            nonlocal done
+            # Only send validators when the previously downloaded copy is still around to reuse
+            cached_path = os.path.join(cache_dir, _cached_name(url)) if cache_dir else None
+            has_cached = cached_path is not None and os.path.exists(cached_path)
+            validators = await _fetch(session, url, sem, filename, http_cache.get(url, {}) if has_cached else {})
+            if validators is None:
+                await _run_file_io(shutil.copyfile, cached_path, filename)
+                sha256 = http_cache[url].get("sha256") or await _run_file_io(file_sha256, filename)
+                message = f"Not modified, reused cached copy for {filename}"
+            else:
+                if cached_path is not None:
+                    await _run_file_io(shutil.copyfile, filename, cached_path)
+                    http_cache[url] = validators
+                sha256 = validators["sha256"]
+                message = f"Successfully downloaded {filename}"
+            files.append((filename, sha256))
+            if downloaded is not None:
+                downloaded.put_nowait((filename, sha256))
+            done += 1
+            progress.add(message, done, len(tasks))
+
+        # Start each download as soon as its link is parsed off the llm.txt stream
+        tasks = []
+        seen_urls = set()
+        seen_filenames = set()
+        async for text, url in iter_markdown_links(session, llm_txt_url):
+            if url in seen_urls:
+                continue
+            seen_urls.add(url)
+            filename = os.path.join(temp_dir, f"{clean_filename(text)}.md")
+            # Two links with the same title would race to write the same file; keep the first
+            if filename in seen_filenames:
+                log_container.warning(f"Skipped {url}: {filename} is already downloaded from another link")
+                continue
+            seen_filenames.add(filename)
+            tasks.append(asyncio.create_task(download(filename, url)))
+        log_container.info(f"Found {len(tasks)} markdown files to download")
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    progress.flush()
+
+    if cache_dir:
+        # Forget URLs that are no longer linked from llm.txt, along with their cached copies
+        for url in http_cache.keys() - seen_urls:
+            del http_cache[url]
+            try:
+                os.remove(os.path.join(cache_dir, _cached_name(url)))
+            except FileNotFoundError:
+                pass
+        save_json(os.path.join(cache_dir, HTTP_CACHE_FILE), http_cache)
+
+    errors = [r for r in results if isinstance(r, BaseException)]
+    for error in errors:
+        log_container.error(f"Failed to download file: {str(error)}")
+    if errors:
+        raise errors[0]
+    return files
+
+async def _upload_worker(downloaded: asyncio.Queue, upload, known_hashes: set,
+                         uploaded: Dict[str, str], progress: ProgressLog) -> None:
+    """Upload downloaded files whose content is not in the manifest until a None sentinel arrives.
+    
+    Failures are only logged: update_assistant_files uploads whatever was not pre-uploaded.
+    """
+    while (item := await downloaded.get()) is not None:
+        path, sha256 = item
+        filename = os.path.basename(path)
+        # Content already in the vector store, possibly under another name, is reused instead
+        if sha256 in known_hashes:
+            continue
+        try:
+            file = await upload(path)
+            uploaded[path] = file.id
+            progress.add(f"Uploaded {filename} while downloading")
+        except Exception as e:
+            progress.log_container.warning(f"Failed to upload {filename} early, will retry later: {str(e)}")
+
+async def _download_and_upload(llm_txt_url: str, temp_dir: str, cache_dir: Optional[str], assistant: Assistant,
+                               status, log_container) -> List[Tuple[str, str, Optional[str]]]:
+    """Download markdown files and upload changed ones to OpenAI storage as each download lands."""
+    old_files = load_json(os.path.join(cache_dir, MANIFEST_FILE)).get("files", {}) if cache_dir else {}
+    known_hashes = {entry["sha256"] for entry in old_files.values()}
+    downloaded = asyncio.Queue()
+    uploaded = {}
+    # Log-only: the progress bar belongs to the downloads
+    progress = ProgressLog(status, log_container)
+    async with assistant.uploader(UPLOAD_CONCURRENCY) as upload:
+        workers = [
+            asyncio.create_task(_upload_worker(downloaded, upload, known_hashes, uploaded, progress))
+            for _ in range(UPLOAD_CONCURRENCY)
+        ]
+        try:
+            files = await _download_all(llm_txt_url, temp_dir, cache_dir, status, log_container, downloaded)
+        except BaseException:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Nothing will use the early uploads, so don't leave them in storage
+            await asyncio.to_thread(assistant.delete_openai_files, list(uploaded.values()))
+            raise
+        for _ in workers:
+            downloaded.put_nowait(None)
+        await asyncio.gather(*workers)
+    progress.flush()
+    return [(path, sha256, uploaded.get(path)) for path, sha256 in files]
+
+def download_markdown_files(llm_txt_url: str, temp_dir: str, status, log_container,
+                            cache_dir: Optional[str] = None,
+                            assistant: Optional[Assistant] = None) -> List[Tuple[str, str, Optional[str]]]:
     """Download markdown files from llm.txt URL.
     
+    Files are hashed while they stream in. If assistant is given, files whose content is
+    not in the manifest in cache_dir are uploaded to OpenAI storage while the remaining
+    downloads are still in flight.
+    
     Args:
         llm_txt_url: URL to the llm.txt file
         temp_dir: Directory to save downloaded files
         status: Streamlit status container
         log_container: Streamlit log container
+        cache_dir: Directory persisting downloaded copies and their ETags across syncs
+        assistant: Assistant used to upload files as soon as they are downloaded
+    Returns:
+        List[Tuple[str, str, Optional[str]]]: (path, sha256, file_id) of every downloaded file,
+        file_id being set only for files uploaded early
     """
     status.write(f"Downloading llm.txt from {llm_txt_url}")
-    response = requests.get(llm_txt_url)
-    response.raise_for_status()
-    md_links = extract_markdown_links(response.text.strip())
-    log_container.info(f"Found {len(md_links)} markdown files to download")
-
-    for i, (text, url) in enumerate(md_links, 1):
-        if not url.strip():
-            continue
-        status.write(f"Downloading file {i}/{len(md_links)}: {url}")
-        
-        clean_text = clean_filename(text)
-        filename = os.path.join(temp_dir, f"{clean_text}.md")
-        
-        response = requests.get(url)
-        response.raise_for_status()
-        with open(filename, 'wb') as f:
-            f.write(response.content)
-        log_container.info(f"Successfully downloaded {filename}")
+    if assistant is None:
+        files = asyncio.run(_download_all(llm_txt_url, temp_dir, cache_dir, status, log_container))
+        return [(path, sha256, None) for path, sha256 in files]
+    return asyncio.run(_download_and_upload(llm_txt_url, temp_dir, cache_dir, assistant, status, log_container))
 
 def clean_filename(text: str) -> str:
     """Clean filename to remove invalid characters and limit length.
@@ -77,7 +387,7 @@ def clean_filename(text: str) -> str:
         str: Cleaned filename
     """
     # Remove invalid filename characters
-    clean_text = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', text)
+    clean_text = _INVALID_FILENAME_RE.sub('_', text)
     # Remove leading/trailing spaces and dots
     clean_text = clean_text.strip('. ')
     # Limit filename length
@@ -85,47 +395,170 @@ def clean_filename(text: str) -> str:
         clean_text = clean_text[:97] + "..."
     return clean_text
 
-def update_assistant_files(client: OpenAI, assistant_id: str, temp_dir: str, status, log_container) -> None:
+def _scan_markdown_files(directory: str) -> List[os.DirEntry]:
+    """Return the regular .md files directly inside directory."""
+    with os.scandir(directory) as entries:
+        return [e for e in entries if e.is_file(follow_symlinks=False) and e.name.endswith('.md')]
+
+def file_sha256(path: str) -> str:
+    """Return the SHA-256 hex digest of a file's content."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def update_assistant_files(client: OpenAI, assistant_id: str, temp_dir: str, status, log_container,
+                           cache_dir: Optional[str] = None,
+                           downloaded: Optional[List[Tuple[str, str, Optional[str]]]] = None) -> None:
     """Update assistant's files by removing old ones and uploading new ones.
     
+    When cache_dir holds a manifest of the assistant's current vector store, only files
+    that were added, changed or removed since the last sync are touched, and a renamed
+    file reuses its existing upload. Otherwise a new vector store is filled and swapped in
+    with a single assistant update, so the assistant never runs without files, and the old
+    vector store is deleted in the background.
+    
     Args:
         client: OpenAI client instance
         assistant_id: The ID of the assistant
         temp_dir: Directory containing new files
         status: Streamlit status container
         log_container: Streamlit log container
+        cache_dir: Directory holding the manifest from the previous sync
+        downloaded: (path, sha256, file_id) from download_markdown_files, so files are not hashed twice
+            and files uploaded while downloading are not uploaded again
     """
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE) if cache_dir else None
+    # 下载时已计算的内容哈希，以及已提前上传的文件
+    known_hashes = {}
+    pre_uploaded = {}
+    for path, sha256, file_id in downloaded or []:
+        filename = os.path.basename(path)
+        known_hashes[filename] = sha256
+        if file_id is not None:
+            pre_uploaded[filename] = (sha256, file_id)
+    # 创建 Assistant 实例
+    assistant = Assistant(assistant_id=assistant_id, client=client)
+    # 全量重建时新建、尚未切换到 assistant 的向量库
+    new_vector_store_id = None
+    # 需要加入向量库的文件，在 assistant 开始使用前失败则需要删除
+    file_id_map = {}
+    committed = False
     try:
-        # 创建 Assistant 实例
-        assistant = Assistant(assistant_id=assistant_id, client=client)
-        
-        # 清空现有文件
-        status.write("Deleting existing files from assistant...")
-        if not assistant.empty_files():
-            log_container.error("Failed to empty existing files")
-            return
-            
-        # 准备文件路径和URL列表
-        files_to_upload = [f for f in os.listdir(temp_dir) if f.endswith('.md')]
+        # 新文件的内容哈希，下载时未计算的才读盘计算
+        new_files = {
+            entry.name: (entry.path, known_hashes.get(entry.name) or file_sha256(entry.path))
+            for entry in _scan_markdown_files(temp_dir)
+        }
+
+        manifest = load_json(manifest_path) if manifest_path else {}
+        old_files = manifest.get("files", {})
+        vector_store_ids = assistant.get_vector_store_ids()
+        incremental = bool(old_files) and vector_store_ids == [manifest.get("vector_store_id")]
+        if incremental and not _vector_store_usable(client, vector_store_ids[0], len(old_files)):
+            # 向量库已过期或文件不完整，增量更新会让助手继续指向不可用的向量库
+            log_container.warning("Vector store from the last sync has expired or is incomplete, rebuilding it")
+            incremental = False
+
+        if incremental:
+            # 增量更新：只删除已移除或已变更的文件，只上传新增或已变更的文件
+            vector_store_id = vector_store_ids[0]
+            files = {
+                filename: entry for filename, entry in old_files.items()
+                if filename in new_files and new_files[filename][1] == entry["sha256"]
+            }
+            stale = {filename: entry for filename, entry in old_files.items() if filename not in files}
+            # 内容未变但改名的文件直接复用原 file_id，无需删除后重新上传
+            stale_by_hash = {entry["sha256"]: filename for filename, entry in stale.items()}
+            for filename, (_, sha256) in new_files.items():
+                if filename not in files and sha256 in stale_by_hash:
+                    files[filename] = stale.pop(stale_by_hash.pop(sha256))
+            to_delete = [entry["file_id"] for entry in stale.values()]
+        else:
+            # 全量重建：先填充新向量库，成功后再切换，旧向量库保持可用直到切换完成
+            status.write("Creating new vector store...")
+            _discard_manifest(manifest_path)
+            new_vector_store_id = vector_store_id = assistant.create_vector_store()
+            files = {}
+            to_delete = []
+
+        # 优先复用下载时已上传的 file_id
         file_paths_and_urls = []
-        for filename in files_to_upload:
-            file_path = os.path.join(temp_dir, filename)
-            # 由于是本地文件，URL可以设为空字符串
-            file_paths_and_urls.append(("", file_path))
-            
-        # 创建新的向量库并上传文件
+        for filename, (file_path, sha256) in new_files.items():
+            if filename in files:
+                continue
+            pre_sha256, file_id = pre_uploaded.get(filename, (None, None))
+            if pre_sha256 == sha256:
+                del pre_uploaded[filename]
+                file_id_map[filename] = file_id
+            else:
+                # 以文件名作为标识，用于记录上传后的 file_id
+                file_paths_and_urls.append((filename, file_path))
+        log_container.info(
+            f"{len(new_files) - len(files)} files to add ({len(file_id_map)} already uploaded), "
+            f"{len(to_delete)} files to remove, {len(files)} unchanged"
+        )
+
+        if to_delete:
+            status.write("Removing changed files from assistant...")
+            if not assistant.remove_files(vector_store_id, to_delete):
+                _discard_manifest(manifest_path)
+                log_container.error("Failed to remove changed files")
+                return
+
         status.write("Uploading new files to assistant...")
-        if not assistant.create_vs(file_paths_and_urls):
-            log_container.error("Failed to create vector store and upload files")
+        if file_paths_and_urls:
+            file_id_map.update((url, file.id) for url, file in assistant.upload_files(file_paths_and_urls))
+        if not assistant.add_files_to_vector_store(list(file_id_map.values()), vector_store_id):
+            _discard_manifest(manifest_path)
+            log_container.error("Failed to add files to vector store")
             return
+
+        if new_vector_store_id is not None:
+            status.write("Switching assistant to new vector store...")
+            assistant.replace_vector_store(new_vector_store_id, list(file_id_map.values()))
+            new_vector_store_id = None
+        committed = True
+
+        if manifest_path:
+            files.update(
+                (filename, {"file_id": file_id, "sha256": new_files[filename][1]})
+                for filename, file_id in file_id_map.items()
+            )
+            save_json(manifest_path, {"vector_store_id": vector_store_id, "files": files})
             
         log_container.info("Successfully updated assistant files")
         status.success("All files updated successfully!")
         
     except Exception as e:
+        _discard_manifest(manifest_path)
         log_container.error(f"Error updating files: {str(e)}")
         status.error(f"Error updating files: {str(e)}")
         raise
+    finally:
+        # 提前上传但最终未使用的文件（如被同名文件覆盖）不再需要；
+        # 失败时，尚未被 assistant 使用的新上传文件同样不再需要
+        unused_file_ids = [file_id for _, file_id in pre_uploaded.values()]
+        if not committed:
+            unused_file_ids.extend(file_id_map.values())
+        # 切换前失败，新建的向量库不再需要，assistant 仍使用旧向量库；其中的文件在下方直接删除
+        if new_vector_store_id is not None:
+            assistant.delete_vector_stores_in_background([new_vector_store_id], unused_file_ids)
+        assistant.delete_openai_files(unused_file_ids)
+
+def _vector_store_usable(client: OpenAI, vector_store_id: str, expected_files: int) -> bool:
+    """Check that a vector store has not expired and still holds every file from the manifest."""
+    try:
+        vector_store = client.vector_stores.retrieve(vector_store_id)
+    except Exception:
+        return False
+    return vector_store.status != "expired" and vector_store.file_counts.completed == expected_files
+
+def _discard_manifest(manifest_path: Optional[str]) -> None:
+    """Drop the manifest so the next sync falls back to a full rebuild."""
+    if manifest_path and os.path.exists(manifest_path):
+        os.remove(manifest_path)
 
 def delete_storage_files(client: OpenAI, file_ids: List[str], status, log_container) -> None:
     """Delete files from OpenAI storage.
@@ -136,38 +569,70 @@ def delete_storage_files(client: OpenAI, file_ids: List[str], status, log_contai
         status: Streamlit status container
         log_container: Streamlit log container
     """
-    for i, file_id in enumerate(file_ids, 1):
-        status.write(f"Deleting file {i}/{len(file_ids)}: {file_id}")
+    if not file_ids:
+        return
+
+    def _delete_one(file_id: str) -> Tuple[str, Optional[Exception]]:
         try:
             client.files.delete(file_id=file_id)
-            log_container.info(f"Successfully deleted file {file_id}")
+            return file_id, None
         except Exception as e:
-            log_container.warning(f"Failed to delete file {file_id}: {str(e)}")
+            return file_id, e
+
+    # Streamlit calls stay on this thread; workers only talk to the API
+    progress = ProgressLog(status, log_container, "Deleting")
+    with ThreadPoolExecutor(max_workers=min(DELETE_CONCURRENCY, len(file_ids))) as executor:
+        futures = [executor.submit(_delete_one, file_id) for file_id in file_ids]
+        for i, future in enumerate(as_completed(futures), 1):
+            file_id, error = future.result()
+            if error is None:
+                progress.add(f"Successfully deleted file {file_id}", i, len(file_ids))
+            else:
+                log_container.warning(f"Failed to delete file {file_id}: {str(error)}")
+                progress.update(i, len(file_ids))
+    progress.flush()
 
-def upload_new_files(client: OpenAI, temp_dir: str, status, log_container) -> List[str]:
-    """Upload new files to OpenAI storage.
+def upload_new_files(client: OpenAI, temp_dir: str, vector_store_id: str, status, log_container) -> List[str]:
+    """Upload new files and attach them to a vector store in a single file batch.
     
     Args:
         client: OpenAI client instance
         temp_dir: Directory containing files to upload
+        vector_store_id: The vector store to attach the files to
         status: Streamlit status container
         log_container: Streamlit log container
     Returns:
         List[str]: List of new file IDs
     """
     status.write("Uploading new files to assistant...")
-    files_to_upload = [f for f in os.listdir(temp_dir) if f.endswith('.md')]
+    files_to_upload = [entry.path for entry in _scan_markdown_files(temp_dir)]
     log_container.info(f"Found {len(files_to_upload)} files to upload")
-    
-    new_file_ids = []
-    for i, filename in enumerate(files_to_upload, 1):
-        status.write(f"Uploading file {i}/{len(files_to_upload)}: {filename}")
-        with open(os.path.join(temp_dir, filename), 'rb') as f:
-            file = client.files.create(file=f, purpose='assistants')
-            new_file_ids.append(file.id)
-        log_container.info(f"Successfully uploaded {filename}")
-    
-    return new_file_ids
+    if not files_to_upload:
+        return []
+
+    # The SDK uploads the streams concurrently, then creates and polls one batch for all of them
+    with ExitStack() as stack:
+        streams = [
+            (os.path.basename(path), stack.enter_context(open(path, 'rb')), 'text/markdown')
+            for path in files_to_upload
+        ]
+        batch = client.vector_stores.file_batches.upload_and_poll(
+            vector_store_id=vector_store_id, files=streams, max_concurrency=UPLOAD_CONCURRENCY
+        )
+    counts = batch.file_counts
+    progress = ProgressLog(status, log_container, "Uploading")
+    progress.add(
+        f"File batch {batch.status}: {counts.completed} completed, {counts.failed} failed",
+        counts.completed, len(files_to_upload)
+    )
+
+    # Only the files of this batch, not everything already in the vector store
+    return [
+        file.id
+        for file in client.vector_stores.file_batches.list_files(
+            batch.id, vector_store_id=vector_store_id, limit=100
+        )
+    ]
 
 def sync_assistant_files(client: OpenAI, assistant: Dict[str, Any]) -> None:
     """
@@ -179,35 +644,44 @@ def sync_assistant_files(client: OpenAI, assistant: Dict[str, Any]) -> None:
     """
     st.write("Starting file sync process...")
     
-    try:
-        # Setup UI
-        back = st.empty()
-        status, log_container = setup_ui_containers()
+    with sync_lock(assistant.get("id", "unknown")) as acquired:
+        if not acquired:
+            st.warning("A sync for this assistant is already in progress")
+            return
+        try:
+            # Setup UI
+            back = st.empty()
+            status, log_container = setup_ui_containers()
         
-        # Create temporary directory
-        temp_dir = create_temp_directory(assistant.get("id", "unknown"))
-        log_container.info(f"Created temporary directory: {temp_dir}")
+            # Create temporary directory
+            temp_dir = create_temp_directory(assistant.get("id", "unknown"))
+            log_container.info(f"Created temporary directory: {temp_dir}")
         
-        # Check llm.txt URL
-        llm_txt_url = assistant.get("llm_txt_url")
-        if not llm_txt_url:
-            status.error("No llm.txt URL configured for this assistant")
-            return
+            # Check llm.txt URL
+            llm_txt_url = assistant.get("llm_txt_url")
+            if not llm_txt_url:
+                status.error("No llm.txt URL configured for this assistant")
+                return
 
-        # Download markdown files
-        download_markdown_files(llm_txt_url, temp_dir, status, log_container)
+            # Download markdown files
+            # Changed files are uploaded to storage while the rest are still downloading
+            cache_dir = get_cache_directory(assistant["id"])
+            downloaded = download_markdown_files(
+                llm_txt_url, temp_dir, status, log_container, cache_dir,
+                Assistant(assistant_id=assistant["id"], client=client)
+            )
         
-        # Update assistant files
-        update_assistant_files(client, assistant["id"], temp_dir, status, log_container)
+            # Update assistant files
+            update_assistant_files(client, assistant["id"], temp_dir, status, log_container, cache_dir, downloaded)
         
-        status.success("All files updated successfully!")
+            status.success("All files updated successfully!")
         
-        # Add hyperlink to return to the chat page with only type parameter
-        current_type = st.query_params.get("type")
-        if current_type:
-            chat_url = f"/?type={current_type}"
-            back.markdown(f"[返回聊天页面]({chat_url})")
+            # Add hyperlink to return to the chat page with only type parameter
+            current_type = st.query_params.get("type")
+            if current_type:
+                chat_url = f"/?type={current_type}"
+                back.markdown(f"[返回聊天页面]({chat_url})")
 
-    except Exception as e:
-        status.error(f"Error updating files: {str(e)}")
-        log_container.exception(e)  # This will show the full traceback 
\ No newline at end of file
+        except Exception as e:
+            status.error(f"Error updating files: {str(e)}")
+            log_container.exception(e)  # This will show the full traceback 
\ No newline at end of file